@@ -2,118 +2,244 @@
 """
 Convert all WAV files in a directory to C arrays
 
-Usage: python3 convert_all.py input_directory output_directory
+Files are converted in parallel, one worker process per CPU core by
+default. Directories of small files (all under 100 KB), where per-file
+I/O outweighs the CPU work, use a thread pool driven by asyncio instead
+(two threads per core); --threads forces this mode. Use --jobs to set the
+number of workers (--jobs 1 converts serially in the current process).
+
+Workers do not print; the main process reports each file as it finishes
+and shows a progress bar when tqdm is installed.
+
+--bits 8 or --ulaw store every file with 8-bit samples (see wav2c.py);
+the master header lists each file's encoding and bit depth.
+
+Usage: python3 convert_all.py input_directory output_directory [--jobs N] [--threads]
+                              [--bits 8 | --ulaw]
 """
 
 import sys
 import os
-from wav2c import convert_wav_to_c
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from wav2c import ENCODINGS, convert_wav_to_c
+
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None
+
+# Files below this size are I/O bound: threads overlap their reads better
+# than processes, which cost more to start than the conversion itself
+SMALL_FILE_SIZE = 100 * 1024
+
+# Conversions queued on the thread pool at any time
+MAX_IN_FLIGHT = 32
+
+def _read_wav(path):
+    """Read a whole file with a single unbuffered read"""
+    with open(path, 'rb', buffering=0) as f:
+        return f.read()
+
+def _convert_one(task, in_memory=False):
+    """Worker: convert a single WAV file, returning (index, result, error)
+
+    With in_memory the file is read once into bytes and converted from
+    there instead of being mapped.
+    """
+    index, input_path, output_path, array_name, encoding = task
+    try:
+        data = _read_wav(input_path) if in_memory else None
+        return index, convert_wav_to_c(input_path, output_path, array_name,
+                                       verbose=False, encoding=encoding, data=data), None
+    except Exception as e:
+        return index, None, str(e)
+
+async def _convert_threaded(tasks, jobs, on_done):
+    """Run conversions on a thread pool, overlapping their file I/O
 
-def convert_directory(input_dir, output_dir):
-    """Convert all WAV files in directory"""
+    on_done is called on the event loop thread as each one finishes.
+    Threads share memory, so each file is read into bytes once and
+    converted from the buffer, skipping the mmap setup that dominates
+    for small files.
+    """
+    loop = asyncio.get_running_loop()
+    sem = asyncio.Semaphore(MAX_IN_FLIGHT)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        async def one(task):
+            async with sem:
+                on_done(await loop.run_in_executor(pool, _convert_one, task, True))
+
+        await asyncio.gather(*(one(task) for task in tasks))
+
+def _c_array(declaration, rows):
+    """C array definition with one initializer per line"""
+    body = ",\n".join(rows) + "\n" if rows else ""
+    return f"{declaration} = {{\n{body}}};\n\n"
+
+def convert_directory(input_dir, output_dir, jobs=None, threads=None, encoding='pcm16'):
+    """Convert all WAV files in directory
+
+    threads selects the thread pool (True) or the process pool (False);
+    None picks threads when every file is smaller than SMALL_FILE_SIZE.
+
+    encoding is applied to every file, see wav2c.ENCODINGS.
+    """
 
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    wav_files = [f for f in os.listdir(input_dir) if f.lower().endswith('.wav')]
+    # scandir gets names and file types from the directory listing itself;
+    # each entry caches its stat() so the size below costs one call
+    with os.scandir(input_dir) as it:
+        wav_files = sorted((e for e in it if e.name.lower().endswith('.wav') and e.is_file()),
+                           key=lambda e: e.name)
 
     if not wav_files:
         print(f"No WAV files found in {input_dir}")
         return
 
-    print(f"Found {len(wav_files)} WAV files")
-    print("=" * 60)
+    if threads is None:
+        threads = all(e.stat().st_size < SMALL_FILE_SIZE for e in wav_files)
 
-    total_size = 0
-    converted = []
+    if jobs is None:
+        jobs = (os.cpu_count() or 1) * (2 if threads else 1)
+    jobs = max(1, min(jobs, len(wav_files)))
 
-    for i, wav_file in enumerate(sorted(wav_files), 1):
-        input_path = os.path.join(input_dir, wav_file)
+    print(f"Found {len(wav_files)} WAV files")
+    if jobs == 1:
+        print("Workers: 1")
+    else:
+        print(f"Workers: {jobs} {'threads' if threads else 'processes'}")
+    print("=" * 60)
 
+    tasks = []
+    for entry in wav_files:
         # Generate array name from filename
-        base = os.path.splitext(wav_file)[0]
+        base = os.path.splitext(entry.name)[0]
         array_name = f"audio_{base.replace('-', '_').replace(' ', '_').replace('.', '_')}"
 
         output_filename = f"audio_{base}.h"
         output_path = os.path.join(output_dir, output_filename)
 
-        print(f"\n[{i}/{len(wav_files)}] {wav_file}")
-
-        try:
-            convert_wav_to_c(input_path, output_path, array_name)
-            size = os.path.getsize(input_path)
-            total_size += size
-            converted.append({
-                'name': wav_file,
-                'array': array_name,
-                'header': output_filename,
-                'size': size
-            })
-        except Exception as e:
-            print(f"  ERROR: {e}")
+        tasks.append((len(tasks), entry.path, output_path, array_name, encoding))
+
+    # Results arrive in completion order; they are reported as they come
+    # and put back in input order afterwards, so the master header stays
+    # deterministic
+    outcomes = [None] * len(tasks)
+    finished = itertools.count(1)
+    progress = tqdm(total=len(tasks), unit="file") if tqdm is not None else None
+    log = tqdm.write if progress is not None else print
+
+    def on_done(outcome):
+        index, result, error = outcome
+        outcomes[index] = outcome
+        entry = wav_files[index]
+
+        if error is not None:
+            status = f"  ERROR: {error}"
+        else:
+            status = (f"  ✓ {os.path.basename(tasks[index][2])}: "
+                      f"{result['array']}_data[{result['num_samples']}], "
+                      f"{result['sample_rate']} Hz, {result['num_channels']}ch, "
+                      f"{result['size_bytes'] / 1024:.1f} KB")
+        # One call per file keeps the progress bar from redrawing in between
+        log(f"\n[{next(finished)}/{len(tasks)}] {entry.name}\n{status}")
+        if progress is not None:
+            progress.update()
+
+    try:
+        if jobs == 1:
+            for task in tasks:
+                on_done(_convert_one(task))
+        elif threads:
+            asyncio.run(_convert_threaded(tasks, jobs, on_done))
+        else:
+            with multiprocessing.Pool(jobs) as pool:
+                for outcome in pool.imap_unordered(_convert_one, tasks):
+                    on_done(outcome)
+    finally:
+        if progress is not None:
+            progress.close()
+
+    total_size = 0
+    converted = []
+
+    for entry, task, (_, result, error) in zip(wav_files, tasks, outcomes):
+        if error is not None:
+            continue
+
+        _, _, output_path, array_name, _ = task
+        # Flash used by the samples, which depends on the encoding
+        size = result['size_bytes']
+        total_size += size
+        converted.append({
+            'name': entry.name,
+            'array': array_name,
+            'header': os.path.basename(output_path),
+            'size': size
+        })
 
     # Generate master header file
     master_header = os.path.join(output_dir, "audio_data.h")
     print(f"\n{'=' * 60}")
     print(f"Generating master header: {master_header}")
 
-    with open(master_header, 'w') as f:
-        f.write("// Auto-generated master header for all audio files\n\n")
-        f.write("#ifndef _AUDIO_DATA_H\n")
-        f.write("#define _AUDIO_DATA_H\n\n")
-
-        # Include all individual headers
-        for item in converted:
-            f.write(f'#include "{item["header"]}"\n')
-
-        f.write("\n// Audio file count\n")
-        f.write(f"#define NUM_AUDIO_FILES {len(converted)}\n\n")
-
-        # Create array of pointers to audio data
-        f.write("// Array of pointers to audio data\n")
-        f.write("const int16_t* const audio_files[NUM_AUDIO_FILES] PROGMEM = {\n")
-        for i, item in enumerate(converted):
-            f.write(f"  {item['array']}_data")
-            if i < len(converted) - 1:
-                f.write(",\n")
-            else:
-                f.write("\n")
-        f.write("};\n\n")
-
-        # Array of sample counts
-        f.write("// Array of sample counts\n")
-        f.write("const uint32_t audio_num_samples[NUM_AUDIO_FILES] PROGMEM = {\n")
-        for i, item in enumerate(converted):
-            f.write(f"  {item['array']}_num_samples")
-            if i < len(converted) - 1:
-                f.write(",\n")
-            else:
-                f.write("\n")
-        f.write("};\n\n")
-
-        # Array of channel counts
-        f.write("// Array of channel counts\n")
-        f.write("const uint16_t audio_num_channels[NUM_AUDIO_FILES] PROGMEM = {\n")
-        for i, item in enumerate(converted):
-            f.write(f"  {item['array']}_num_channels")
-            if i < len(converted) - 1:
-                f.write(",\n")
-            else:
-                f.write("\n")
-        f.write("};\n\n")
-
-        # Array of filenames
-        f.write("// Array of original filenames\n")
-        f.write("const char* const audio_filenames[NUM_AUDIO_FILES] PROGMEM = {\n")
-        for i, item in enumerate(converted):
-            f.write(f'  "{item["name"]}"')
-            if i < len(converted) - 1:
-                f.write(",\n")
-            else:
-                f.write("\n")
-        f.write("};\n\n")
-
-        f.write("#endif // _AUDIO_DATA_H\n")
+    # One pass over the converted files fills every table's rows
+    includes, ptrs, num_samples, num_channels, filenames = [], [], [], [], []
+    bits_per_sample, encodings = [], []
+    for item in converted:
+        includes.append(f'#include "{item["header"]}"\n')
+        ptrs.append(f"  {item['array']}_data")
+        num_samples.append(f"  {item['array']}_num_samples")
+        num_channels.append(f"  {item['array']}_num_channels")
+        bits_per_sample.append(f"  {item['array']}_bits_per_sample")
+        encodings.append(f"  {item['array']}_encoding")
+        filenames.append(f'  "{item["name"]}"')
+
+    out = []
+    out.append("// Auto-generated master header for all audio files\n\n")
+    out.append("#ifndef _AUDIO_DATA_H\n")
+    out.append("#define _AUDIO_DATA_H\n\n")
+
+    # Include all individual headers
+    out.extend(includes)
+
+    out.append("\n// Audio file count\n")
+    out.append(f"#define NUM_AUDIO_FILES {len(converted)}\n\n")
+
+    # Create array of pointers to audio data
+    out.append("// Array of pointers to audio data\n")
+    ctype = ENCODINGS[encoding][0]
+    out.append(_c_array(f"const {ctype}* const audio_files[NUM_AUDIO_FILES] PROGMEM", ptrs))
+
+    # Array of sample counts
+    out.append("// Array of sample counts\n")
+    out.append(_c_array("const uint32_t audio_num_samples[NUM_AUDIO_FILES] PROGMEM", num_samples))
+
+    # Array of channel counts
+    out.append("// Array of channel counts\n")
+    out.append(_c_array("const uint16_t audio_num_channels[NUM_AUDIO_FILES] PROGMEM", num_channels))
+
+    # Array of sample formats, so the player can dispatch on them
+    out.append("// Array of bits per sample\n")
+    out.append(_c_array("const uint8_t audio_bits_per_sample[NUM_AUDIO_FILES] PROGMEM", bits_per_sample))
+    out.append("// Array of sample encodings (AUDIO_ENCODING_*)\n")
+    out.append(_c_array("const uint8_t audio_encodings[NUM_AUDIO_FILES] PROGMEM", encodings))
+
+    # Array of filenames
+    out.append("// Array of original filenames\n")
+    out.append(_c_array("const char* const audio_filenames[NUM_AUDIO_FILES] PROGMEM", filenames))
+
+    out.append("#endif // _AUDIO_DATA_H\n")
+
+    with open(master_header, 'wb') as f:
+        f.write(''.join(out).encode('utf-8'))
 
     print(f"\n{'=' * 60}")
     print(f"Conversion complete!")
@@ -129,21 +255,38 @@ def convert_directory(input_dir, output_dir):
         print(f"   Your files ({total_size / 1024 / 1024:.1f} MB) should fit.")
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python3 convert_all.py input_directory output_directory")
-        print("\nExample:")
-        print("  python3 convert_all.py ~/my_wav_files ./audio_data")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Convert all WAV files in a directory to C arrays",
+        epilog="Example:\n  python3 convert_all.py ~/my_wav_files ./audio_data",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input_directory")
+    parser.add_argument("output_directory")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of workers (default: CPU count, "
+                             "twice that for threads)")
+    parser.add_argument("--threads", action="store_true", default=None,
+                        help="use a thread pool even for large files")
+    sample_format = parser.add_mutually_exclusive_group()
+    sample_format.add_argument("--bits", type=int, choices=(8, 16), default=16,
+                               help="bits per stored sample (default: 16)")
+    sample_format.add_argument("--ulaw", action="store_true",
+                               help="store 8-bit u-law samples")
+    args = parser.parse_args()
 
-    input_dir = sys.argv[1]
-    output_dir = sys.argv[2]
+    input_dir = args.input_directory
+    output_dir = args.output_directory
 
     if not os.path.isdir(input_dir):
         print(f"ERROR: {input_dir} is not a directory")
         sys.exit(1)
 
+    if args.jobs is not None and args.jobs < 1:
+        print("ERROR: --jobs must be at least 1")
+        sys.exit(1)
+
     try:
-        convert_directory(input_dir, output_dir)
+        encoding = 'ulaw' if args.ulaw else f"pcm{args.bits}"
+        convert_directory(input_dir, output_dir, args.jobs, args.threads, encoding)
     except Exception as e:
         print(f"ERROR: {e}")
         import traceback
@@ -3,146 +3,297 @@
 WAV to C Array Converter for RP2350
 Converts WAV files to C arrays for embedding in flash memory
 
-Usage: python3 wav2c.py input.wav output.h [array_name]
+Samples are decoded with the array module. By default they are stored
+as 16-bit PCM; --bits 8 stores the top 8 bits of each sample and --ulaw
+stores 8-bit u-law codes (decoded by ulaw_decode_table in
+src/data_ulaw.c), halving the flash used.
+
+Usage: python3 wav2c.py input.wav output.h [array_name] [--bits 8 | --ulaw]
 """
 
 import sys
 import struct
 import os
+import mmap
+import array
+import argparse
+import contextlib
+import itertools
+import threading
 
-def read_wav_header(f):
-    """Read and parse WAV file header"""
-    # Read RIFF header
-    riff = f.read(4)
-    if riff != b'RIFF':
-        raise ValueError("Not a valid WAV file (missing RIFF)")
+SAMPLES_PER_LINE = 12
+
+# Samples decoded and formatted per step of the streaming conversion
+SAMPLES_PER_BLOCK = SAMPLES_PER_LINE * 4096
+
+# The generated header is written in blocks of a few hundred KB; a large
+# buffer lets them reach the OS in a few big chunks
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# WAV header layouts, compiled once: RIFF header + fmt chunk header,
+# the 16-byte PCM fmt body, and a generic chunk header
+_RIFF_FMT_HEADER = struct.Struct('<4sI4s4sI')
+_FMT_BODY = struct.Struct('<HHIIHH')
+_CHUNK_HEADER = struct.Struct('<4sI')
+
+def _ulaw_encode(sample):
+    """u-law code of an int16 sample, as read by ulaw_decode_table
+
+    Same companding as G.711 but without its final bit inversion, which
+    is the layout src/data_ulaw.c decodes.
+    """
+    if sample >= 0:
+        mag, neg = sample, 0
+    else:
+        mag, neg = -sample, 0x80
+    mag = min(mag + 128, 0x7FFF)
+    segment = mag.bit_length() - 8
+    return neg | (segment << 4) | ((mag >> (segment + 3)) & 0x0F)
+
+# Sample encodings: C type, bits per sample, text width and the function
+# mapping an int16 sample to its stored value (None keeps it as is)
+ENCODINGS = {
+    'pcm16': ('int16_t', 16, 6, None),
+    'pcm8': ('int8_t', 8, 4, lambda s: s >> 8),
+    'ulaw': ('uint8_t', 8, 3, _ulaw_encode),
+}
+
+def _build_row_layout(encoding):
+    """Per-column lookup tables formatting int16 samples in an encoding
+
+    Row layout specialized for SAMPLES_PER_LINE: one table per column,
+    indexed by the int16 sample, each entry holding the encoded value's
+    text and its separator, so a whole block is encoded and formatted by
+    a single join with no per-row Python work. The last column ends the
+    line and indents the next one. Negative samples sit at the end of
+    each table, so a sample indexes it directly. ~8 MB for pcm16, much
+    less for the 8-bit encodings, whose 256 distinct strings are shared.
+    """
+    _, _, width, encode = ENCODINGS[encoding]
+    samples = [*range(32768), *range(-32768, 0)]
+    codes = samples if encode is None else [encode(s) for s in samples]
+    text = {c: f"{c:{width}d}" for c in set(codes)}
+    sep = {c: t + ", " for c, t in text.items()}
+    eol = {c: t + ",\n  " for c, t in text.items()}
+    return ([[sep[c] for c in codes]] * (SAMPLES_PER_LINE - 1)
+            + [[eol[c] for c in codes]])
+
+# The default layout is built once at import, so forked workers inherit
+# it; the 8-bit ones on first use, under a lock so concurrent threads
+# of convert_all build each only once
+_ROW_LAYOUTS = {'pcm16': _build_row_layout('pcm16')}
+_ROW_LAYOUTS_LOCK = threading.Lock()
+
+def _row_layout(encoding):
+    """Row layout for encoding, see _build_row_layout"""
+    layout = _ROW_LAYOUTS.get(encoding)
+    if layout is None:
+        with _ROW_LAYOUTS_LOCK:
+            layout = _ROW_LAYOUTS.get(encoding)
+            if layout is None:
+                layout = _ROW_LAYOUTS[encoding] = _build_row_layout(encoding)
+    return layout
+
+@contextlib.contextmanager
+def _map_wav(path):
+    """Map a WAV file read-only for the duration of the with block"""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        yield mm
+
+def read_wav_header(buf):
+    """Parse WAV file header from a bytes-like object (e.g. an mmap)
 
-    file_size = struct.unpack('<I', f.read(4))[0]
+    Chunks are located by offset, nothing is copied. The returned dict
+    includes 'data_offset', the position of the sample data in buf.
+    """
+    if len(buf) < _RIFF_FMT_HEADER.size + _FMT_BODY.size:
+        raise ValueError("Not a valid WAV file (too short)")
 
-    wave = f.read(4)
+    riff, file_size, wave, fmt, fmt_size = _RIFF_FMT_HEADER.unpack_from(buf, 0)
+    if riff != b'RIFF':
+        raise ValueError("Not a valid WAV file (missing RIFF)")
     if wave != b'WAVE':
         raise ValueError("Not a valid WAV file (missing WAVE)")
-
-    # Read fmt chunk
-    fmt = f.read(4)
     if fmt != b'fmt ':
         raise ValueError("Missing fmt chunk")
 
-    fmt_size = struct.unpack('<I', f.read(4))[0]
-    audio_format = struct.unpack('<H', f.read(2))[0]
-    num_channels = struct.unpack('<H', f.read(2))[0]
-    sample_rate = struct.unpack('<I', f.read(4))[0]
-    byte_rate = struct.unpack('<I', f.read(4))[0]
-    block_align = struct.unpack('<H', f.read(2))[0]
-    bits_per_sample = struct.unpack('<H', f.read(2))[0]
+    (audio_format, num_channels, sample_rate,
+     byte_rate, block_align, bits_per_sample) = _FMT_BODY.unpack_from(buf, _RIFF_FMT_HEADER.size)
 
     # Skip any extra fmt data
-    if fmt_size > 16:
-        f.read(fmt_size - 16)
+    pos = _RIFF_FMT_HEADER.size + max(fmt_size, _FMT_BODY.size)
 
     # Find data chunk
     while True:
-        chunk_id = f.read(4)
-        if not chunk_id:
+        if pos + _CHUNK_HEADER.size > len(buf):
             raise ValueError("No data chunk found")
-        chunk_size = struct.unpack('<I', f.read(4))[0]
+        chunk_id, chunk_size = _CHUNK_HEADER.unpack_from(buf, pos)
+        pos += _CHUNK_HEADER.size
 
         if chunk_id == b'data':
             break
         else:
-            # Skip this chunk
-            f.read(chunk_size)
+            # Skip this chunk and its pad byte (chunks are word-aligned)
+            pos += chunk_size + (chunk_size & 1)
+
+    # A truncated file holds less data than the chunk header claims
+    data_size = min(chunk_size, len(buf) - pos)
 
     return {
         'sample_rate': sample_rate,
         'num_channels': num_channels,
         'bits_per_sample': bits_per_sample,
-        'data_size': chunk_size,
-        'num_samples': chunk_size // (bits_per_sample // 8)
+        'data_offset': pos,
+        'data_size': data_size,
+        'num_samples': data_size // (bits_per_sample // 8)
     }
 
-def convert_wav_to_c(input_wav, output_h, array_name=None):
-    """Convert WAV file to C header with array"""
+def read_samples(buf, offset, count):
+    """Decode count little-endian int16 samples from buf at offset"""
+    samples = array.array('h')
+    samples.frombytes(buf[offset:offset + count * 2])
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    return samples
+
+def format_rows(samples, encoding='pcm16'):
+    """Format int16 samples as C initializer rows in the given encoding,
+    12 per line, each ending in ",\n" """
+    if not len(samples):
+        return ""
+    layout = _row_layout(encoding)
+    text = "  " + "".join(map(list.__getitem__, itertools.cycle(layout), samples))
+    # A full last row ends in ",\n  ", a partial one in ", "
+    return text[:-2] if len(samples) % SAMPLES_PER_LINE == 0 else text[:-1] + "\n"
+
+def convert_wav_to_c(input_wav, output_h, array_name=None, verbose=True, encoding='pcm16',
+                     data=None):
+    """Convert WAV file to C header with array
+
+    encoding is one of ENCODINGS: 'pcm16' (default), 'pcm8' or 'ulaw'.
+    data, if given, is the WAV file already read into memory (any
+    bytes-like object); input_wav then only names it and is not opened.
+    Returns a dict with the array name and audio metadata so callers
+    (e.g. convert_all.py worker processes) can collect results without
+    parsing stdout. Pass verbose=False to suppress progress output.
+    """
+
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding: {encoding}")
+    ctype, bits, _, _ = ENCODINGS[encoding]
 
     if array_name is None:
         # Generate array name from filename
         base = os.path.splitext(os.path.basename(input_wav))[0]
         array_name = base.replace('-', '_').replace(' ', '_').replace('.', '_')
 
-    print(f"Converting {input_wav} -> {output_h}")
-    print(f"Array name: {array_name}")
+    if verbose:
+        print(f"Converting {input_wav} -> {output_h}")
+        print(f"Array name: {array_name}")
 
-    with open(input_wav, 'rb') as f:
-        header = read_wav_header(f)
+    # Use the caller's in-memory bytes if given, else map the file: samples
+    # are decoded straight from the page cache without a private copy
+    source = contextlib.nullcontext(data) if data is not None else _map_wav(input_wav)
+    with source as buf:
+        header = read_wav_header(buf)
 
-        print(f"Sample rate: {header['sample_rate']} Hz")
-        print(f"Channels: {header['num_channels']}")
-        print(f"Bits per sample: {header['bits_per_sample']}")
-        print(f"Data size: {header['data_size']} bytes")
-        print(f"Num samples: {header['num_samples']}")
+        if verbose:
+            print(f"Sample rate: {header['sample_rate']} Hz")
+            print(f"Channels: {header['num_channels']}")
+            print(f"Bits per sample: {header['bits_per_sample']}")
+            print(f"Data size: {header['data_size']} bytes")
+            print(f"Num samples: {header['num_samples']}")
 
         if header['bits_per_sample'] != 16:
             raise ValueError("Only 16-bit WAV files are supported")
 
-        # Read all audio data
-        audio_data = f.read(header['data_size'])
+        num_samples = header['num_samples']
+        size_bytes = num_samples * bits // 8
 
-    # Convert to 16-bit signed samples
-    num_samples = len(audio_data) // 2
-    samples = struct.unpack(f'<{num_samples}h', audio_data)
+        prologue = (
+            f"// Auto-generated from {os.path.basename(input_wav)}\n"
+            f"// Sample rate: {header['sample_rate']} Hz\n"
+            f"// Channels: {header['num_channels']}\n"
+            f"// Samples: {num_samples}\n"
+            f"// Encoding: {encoding}\n"
+            f"// Size: {size_bytes} bytes ({size_bytes/1024:.1f} KB)\n\n"
+            f"#ifndef _{array_name.upper()}_H\n"
+            f"#define _{array_name.upper()}_H\n\n"
+            f"#include <stdint.h>\n\n"
+            # Shared by every generated header
+            f"#ifndef AUDIO_ENCODING_PCM16\n"
+            f"#define AUDIO_ENCODING_PCM16 0\n"
+            f"#define AUDIO_ENCODING_PCM8 1\n"
+            f"#define AUDIO_ENCODING_ULAW 2\n"
+            f"#endif\n\n"
+            # Audio data array
+            f"const {ctype} {array_name}_data[] PROGMEM = {{\n"
+        )
+        epilogue = (
+            "};\n\n"
+            # Metadata
+            f"const uint32_t {array_name}_sample_rate = {header['sample_rate']};\n"
+            f"const uint16_t {array_name}_num_channels = {header['num_channels']};\n"
+            f"const uint32_t {array_name}_num_samples = {num_samples};\n"
+            f"const uint32_t {array_name}_size_bytes = {size_bytes};\n"
+            f"const uint8_t {array_name}_bits_per_sample = {bits};\n"
+            f"const uint8_t {array_name}_encoding = AUDIO_ENCODING_{encoding.upper()};\n\n"
+            f"#endif // _{array_name.upper()}_H\n"
+        )
 
-    # Write C header file
-    with open(output_h, 'w') as f:
-        f.write(f"// Auto-generated from {os.path.basename(input_wav)}\n")
-        f.write(f"// Sample rate: {header['sample_rate']} Hz\n")
-        f.write(f"// Channels: {header['num_channels']}\n")
-        f.write(f"// Samples: {num_samples}\n")
-        f.write(f"// Size: {len(audio_data)} bytes ({len(audio_data)/1024:.1f} KB)\n\n")
+        # Single streaming pass: each block of samples is decoded from the
+        # mapping, formatted and written before the next one is touched,
+        # so the kernel's sequential readahead applies and memory use does
+        # not grow with the file. Generated code is ASCII apart from the
+        # source file name; it is encoded here and written in binary mode,
+        # skipping the text I/O layer.
+        with open(output_h, 'wb', buffering=OUTPUT_BUFFER_SIZE) as out:
+            out.write(prologue.encode('utf-8'))
 
-        f.write(f"#ifndef _{array_name.upper()}_H\n")
-        f.write(f"#define _{array_name.upper()}_H\n\n")
+            for start in range(0, num_samples, SAMPLES_PER_BLOCK):
+                count = min(SAMPLES_PER_BLOCK, num_samples - start)
+                rows = format_rows(read_samples(buf, header['data_offset'] + start * 2, count), encoding)
+                if start + count == num_samples:
+                    # No comma after the final row
+                    rows = rows[:-2] + "\n"
+                out.write(rows.encode('ascii'))
 
-        f.write(f"#include <stdint.h>\n\n")
+            out.write(epilogue.encode('utf-8'))
 
-        # Audio data array
-        f.write(f"const int16_t {array_name}_data[] PROGMEM = {{\n")
+    if verbose:
+        print(f"✓ Created {output_h}")
+        print(f"  Array: {array_name}_data[{num_samples}]")
+        print(f"  Size: {size_bytes/1024:.1f} KB")
 
-        # Write samples, 12 per line
-        for i in range(0, len(samples), 12):
-            chunk = samples[i:i+12]
-            f.write("  " + ", ".join(f"{s:6d}" for s in chunk))
-            if i + 12 < len(samples):
-                f.write(",\n")
-            else:
-                f.write("\n")
-
-        f.write("};\n\n")
-
-        # Metadata
-        f.write(f"const uint32_t {array_name}_sample_rate = {header['sample_rate']};\n")
-        f.write(f"const uint16_t {array_name}_num_channels = {header['num_channels']};\n")
-        f.write(f"const uint32_t {array_name}_num_samples = {num_samples};\n")
-        f.write(f"const uint32_t {array_name}_size_bytes = {len(audio_data)};\n\n")
-
-        f.write(f"#endif // _{array_name.upper()}_H\n")
-
-    print(f"✓ Created {output_h}")
-    print(f"  Array: {array_name}_data[{num_samples}]")
-    print(f"  Size: {len(audio_data)/1024:.1f} KB")
+    return {
+        'array': array_name,
+        'sample_rate': header['sample_rate'],
+        'num_channels': header['num_channels'],
+        'num_samples': num_samples,
+        'size_bytes': size_bytes,
+        'bits_per_sample': bits,
+        'encoding': encoding
+    }
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python3 wav2c.py input.wav output.h [array_name]")
-        print("\nExample:")
-        print("  python3 wav2c.py kick.wav audio_kick.h kick")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Convert a WAV file to a C array",
+        epilog="Example:\n  python3 wav2c.py kick.wav audio_kick.h kick",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input_wav")
+    parser.add_argument("output_h")
+    parser.add_argument("array_name", nargs="?")
+    sample_format = parser.add_mutually_exclusive_group()
+    sample_format.add_argument("--bits", type=int, choices=(8, 16), default=16,
+                               help="bits per stored sample (default: 16)")
+    sample_format.add_argument("--ulaw", action="store_true",
+                               help="store 8-bit u-law samples")
+    args = parser.parse_args()
 
-    input_wav = sys.argv[1]
-    output_h = sys.argv[2]
-    array_name = sys.argv[3] if len(sys.argv) > 3 else None
+    encoding = 'ulaw' if args.ulaw else f"pcm{args.bits}"
 
     try:
-        convert_wav_to_c(input_wav, output_h, array_name)
+        convert_wav_to_c(args.input_wav, args.output_h, args.array_name, encoding=encoding)
     except Exception as e:
         print(f"ERROR: {e}")
         sys.exit(1)
@@ -18,22 +18,48 @@ Only use PROGMEM for:
     - Very small files (<100KB)
     - 1-2 files max
     - When you need absolute maximum speed
+
+Output modes:
+    - Default: a small header stub plus an assembler file (.S) that pulls
+      a raw copy of the WAV (.bin) into flash with the .incbin directive.
+      No hex expansion, so conversion and compilation are fast.
+    - --ascii: the whole WAV as a hex C array in the header. Use this for
+      toolchains that cannot assemble .S files.
 """
 
 import sys
 import struct
 import os
+import mmap
+import shutil
+import errno
+import contextlib
 
-def wav_to_header(wav_path, var_name=None):
-    """
-    Convert WAV file to C++ header with PROGMEM array
+# The header is encoded once and written with a single f.write() in
+# binary mode; a large buffer lets it reach the OS in a few big chunks
+OUTPUT_BUFFER_SIZE = 1 << 20
 
-    Args:
-        wav_path: Path to WAV file
-        var_name: Variable name (default: filename without extension)
+# WAV layouts, compiled once: a chunk header and the 16-byte PCM fmt body
+_CHUNK_HEADER = struct.Struct('<4sI')
+_FMT_BODY = struct.Struct('<HHIIHH')
+
+# Files smaller than this are read in one go instead of mapped: for a
+# small file one read() is cheaper than setting up and tearing down a map
+MMAP_THRESHOLD = 256 * 1024
+
+# Hex array layout: "0xAB, " is 6 characters per byte
+BYTES_PER_LINE = 12
+_LINE_STRIDE = BYTES_PER_LINE * 6
+
+# Bytes hex-encoded per step of format_hex_body (whole rows)
+BYTES_PER_BLOCK = BYTES_PER_LINE * 4096
+
+def check_wav_size(wav_path):
+    """
+    Print file info and warn about flash size
 
     Returns:
-        String containing C++ header code
+        File size in bytes, or None if the user cancelled
     """
 
     if not os.path.exists(wav_path):
@@ -55,43 +81,149 @@ def wav_to_header(wav_path, var_name=None):
         if response.lower() != 'yes':
             return None
 
-    # Default variable name from filename
-    if var_name is None:
-        var_name = os.path.splitext(os.path.basename(wav_path))[0]
-        var_name = var_name.replace('-', '_').replace(' ', '_')
+    return file_size
+
+@contextlib.contextmanager
+def open_wav_data(wav_path, file_size):
+    """
+    Give access to the whole WAV file as a bytes-like object
+
+    Large files are memory-mapped. Small ones are read in a single call
+    through an unbuffered (raw) file, which skips the BufferedReader that
+    a whole-file read gains nothing from.
+    """
+
+    with open(wav_path, 'rb', buffering=0) as f:
+        if file_size < MMAP_THRESHOLD:
+            yield f.read()
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as wav_data:
+                yield wav_data
+
+def format_hex_body(wav_data):
+    """
+    Format bytes as C array rows, 12 per line: "  0x52, 0x49, ...,"
 
-    # Read WAV file
-    with open(wav_path, 'rb') as f:
-        wav_data = f.read()
+    All per-byte work happens in C: memoryview.hex(' ') encodes the data,
+    str.replace turns the separators into ", 0x". Since every byte takes
+    exactly 6 characters, rows are then fixed-width slices. The data is
+    encoded a block of whole rows at a time, so the intermediate strings
+    stay small instead of each being a copy of the whole file's text.
+    """
+
+    blocks = []
+    with memoryview(wav_data) as mv:
+        for start in range(0, len(mv), BYTES_PER_BLOCK):
+            with mv[start:start + BYTES_PER_BLOCK] as block:
+                hex_data = '0x' + block.hex(' ').upper().replace(' ', ', 0x') + ','
+
+            # Each slice ends with the row's trailing comma; the space after
+            # it (position 71 of each 72-character stride) is dropped
+            rows = [hex_data[i:i+_LINE_STRIDE-1] for i in range(0, len(hex_data), _LINE_STRIDE)]
+            blocks.append('  ' + '\n  '.join(rows))
+    return '\n'.join(blocks)
+
+def default_var_name(wav_path):
+    """Variable name from filename"""
+    var_name = os.path.splitext(os.path.basename(wav_path))[0]
+    return var_name.replace('-', '_').replace(' ', '_')
+
+def parse_wav_format(wav_data):
+    """
+    Parse the fmt chunk of a WAV file
+
+    Returns:
+        Dict with audio_format, num_channels, sample_rate, bits_per_sample
+    """
 
-    # Parse WAV header
     if wav_data[:4] != b'RIFF' or wav_data[8:12] != b'WAVE':
         raise ValueError("Invalid WAV file format")
 
-    # Find format chunk
-    fmt_offset = wav_data.find(b'fmt ')
-    if fmt_offset == -1:
-        raise ValueError("No format chunk found")
+    # Walk the chunk list from the end of the RIFF header instead of
+    # searching the whole file for b'fmt ' (chunks are word-aligned, an
+    # odd-sized chunk is followed by a pad byte)
+    pos = 12
+    while True:
+        if pos + _CHUNK_HEADER.size > len(wav_data):
+            raise ValueError("No format chunk found")
+        chunk_id, chunk_size = _CHUNK_HEADER.unpack_from(wav_data, pos)
+        if chunk_id == b'fmt ':
+            break
+        if chunk_id == b'data':
+            raise ValueError("No format chunk found before data chunk")
+        pos += _CHUNK_HEADER.size + chunk_size + (chunk_size & 1)
+
+    fmt_offset = pos + _CHUNK_HEADER.size
+    if chunk_size < _FMT_BODY.size or fmt_offset + _FMT_BODY.size > len(wav_data):
+        raise ValueError("Format chunk too short")
+
+    (audio_format, num_channels, sample_rate,
+     byte_rate, block_align, bits_per_sample) = _FMT_BODY.unpack_from(wav_data, fmt_offset)
+
+    wav_format = {
+        'audio_format': audio_format,
+        'num_channels': num_channels,
+        'sample_rate': sample_rate,
+        'bits_per_sample': bits_per_sample,
+    }
+
+    print(f"Format: {wav_format['sample_rate']}Hz, {wav_format['bits_per_sample']}-bit, "
+          f"{wav_format['num_channels']} channel(s)")
+
+    if wav_format['audio_format'] != 1:
+        print("⚠️  WARNING: Not PCM format - may not work correctly")
 
-    fmt_size = struct.unpack('<I', wav_data[fmt_offset+4:fmt_offset+8])[0]
-    fmt_data = wav_data[fmt_offset+8:fmt_offset+8+fmt_size]
+    return wav_format
+
+def _header_comment(wav_path, file_size, wav_format, title):
+    """Common comment block at the top of generated files"""
+    return [
+        f"// {title}",
+        f"// Source: {os.path.basename(wav_path)}",
+        f"// Size: {file_size / (1024 * 1024):.2f} MB ({file_size} bytes)",
+        f"// Format: {wav_format['sample_rate']}Hz, {wav_format['bits_per_sample']}-bit, "
+        f"{wav_format['num_channels']}ch",
+    ]
+
+def _metadata(var_name, file_size, wav_format):
+    """Size and format constants shared by both output modes"""
+    return [
+        f"const uint32_t {var_name}_size = {file_size};",
+        "",
+        "// Metadata",
+        f"const uint32_t {var_name}_sample_rate = {wav_format['sample_rate']};",
+        f"const uint16_t {var_name}_bits_per_sample = {wav_format['bits_per_sample']};",
+        f"const uint16_t {var_name}_num_channels = {wav_format['num_channels']};",
+    ]
 
-    audio_format = struct.unpack('<H', fmt_data[0:2])[0]
-    num_channels = struct.unpack('<H', fmt_data[2:4])[0]
-    sample_rate = struct.unpack('<I', fmt_data[4:8])[0]
-    bits_per_sample = struct.unpack('<H', fmt_data[14:16])[0]
+def wav_to_header(wav_path, var_name=None):
+    """
+    Convert WAV file to C++ header with PROGMEM array
+
+    Args:
+        wav_path: Path to WAV file
+        var_name: Variable name (default: filename without extension)
 
-    print(f"Format: {sample_rate}Hz, {bits_per_sample}-bit, {num_channels} channel(s)")
+    Returns:
+        String containing C++ header code
+    """
 
-    if audio_format != 1:
-        print("⚠️  WARNING: Not PCM format - may not work correctly")
+    file_size = check_wav_size(wav_path)
+    if file_size is None:
+        return None
+
+    if var_name is None:
+        var_name = default_var_name(wav_path)
+
+    # Large files are mapped: lines are formatted straight from the page
+    # cache instead of from a private copy of the whole file
+    with open_wav_data(wav_path, file_size) as wav_data:
+        wav_format = parse_wav_format(wav_data)
+
+        data_body = format_hex_body(wav_data)
 
     # Generate header file
-    header = []
-    header.append("// Auto-generated WAV file array")
-    header.append(f"// Source: {os.path.basename(wav_path)}")
-    header.append(f"// Size: {file_size_mb:.2f} MB ({file_size} bytes)")
-    header.append(f"// Format: {sample_rate}Hz, {bits_per_sample}-bit, {num_channels}ch")
+    header = _header_comment(wav_path, file_size, wav_format, "Auto-generated WAV file array")
     header.append("")
     header.append("#ifndef WAV_DATA_H")
     header.append("#define WAV_DATA_H")
@@ -101,74 +233,181 @@ def wav_to_header(wav_path, var_name=None):
     header.append(f"// WAV data array - stored in FLASH memory")
     header.append(f"const uint8_t {var_name}_data[] PROGMEM = {{")
 
-    # Write data in chunks of 12 bytes per line
-    bytes_per_line = 12
-    for i in range(0, len(wav_data), bytes_per_line):
-        chunk = wav_data[i:i+bytes_per_line]
-        hex_values = ', '.join(f'0x{b:02X}' for b in chunk)
-        header.append(f"  {hex_values},")
+    header.append(data_body)
 
     header.append("};")
     header.append("")
-    header.append(f"const uint32_t {var_name}_size = {file_size};")
-    header.append("")
-    header.append("// Metadata")
-    header.append(f"const uint32_t {var_name}_sample_rate = {sample_rate};")
-    header.append(f"const uint16_t {var_name}_bits_per_sample = {bits_per_sample};")
-    header.append(f"const uint16_t {var_name}_num_channels = {num_channels};")
+    header.extend(_metadata(var_name, file_size, wav_format))
     header.append("")
     header.append("#endif // WAV_DATA_H")
     header.append("")
 
     return '\n'.join(header)
 
+def wav_to_incbin(wav_path, data_path, var_name=None):
+    """
+    Convert WAV file to a C++ header stub plus an assembler file that
+    embeds the raw WAV bytes with .incbin
+
+    Args:
+        wav_path: Path to WAV file
+        data_path: Path of the raw copy referenced by .incbin
+        var_name: Variable name (default: filename without extension)
+
+    Returns:
+        Tuple (header code, assembler code), or None if cancelled
+    """
+
+    file_size = check_wav_size(wav_path)
+    if file_size is None:
+        return None
+
+    if var_name is None:
+        var_name = default_var_name(wav_path)
+
+    # Only the header is parsed; for mapped files just its pages are read
+    with open_wav_data(wav_path, file_size) as wav_data:
+        wav_format = parse_wav_format(wav_data)
+
+    # The Arduino builder copies sketch sources to a build directory, so
+    # .incbin needs an absolute path to find the data file
+    incbin_path = os.path.abspath(data_path).replace('\\', '/')
+
+    header = _header_comment(wav_path, file_size, wav_format, "Auto-generated WAV file stub")
+    header.append(f"// Data: {os.path.basename(data_path)}, embedded via .incbin")
+    header.append("")
+    header.append("#ifndef WAV_DATA_H")
+    header.append("#define WAV_DATA_H")
+    header.append("")
+    header.append("#include <Arduino.h>")
+    header.append("")
+    header.append("// WAV data - stored in FLASH memory, defined in the .S file")
+    header.append("#ifdef __cplusplus")
+    header.append('extern "C" {')
+    header.append("#endif")
+    header.append(f"extern const uint8_t {var_name}_data[];")
+    header.append("#ifdef __cplusplus")
+    header.append("}")
+    header.append("#endif")
+    header.append("")
+    header.extend(_metadata(var_name, file_size, wav_format))
+    header.append("")
+    header.append("#endif // WAV_DATA_H")
+    header.append("")
+
+    asm = [
+        f"/* Auto-generated from {os.path.basename(wav_path)} - raw WAV data in flash */",
+        "",
+        f"    .section .rodata.{var_name}_data, \"a\"",
+        f"    .global {var_name}_data",
+        f"    .type {var_name}_data, %object",
+        "    .balign 4",
+        f"{var_name}_data:",
+        f"    .incbin \"{incbin_path}\"",
+        f"    .size {var_name}_data, . - {var_name}_data",
+        "",
+    ]
+
+    return '\n'.join(header), '\n'.join(asm)
+
+def preallocate(f, size):
+    """
+    Reserve disk space for an output file before writing it
+
+    A multi-MB header written in one go then lands in few, contiguous
+    extents, and a full disk fails here rather than halfway through.
+    Only available on POSIX systems; a no-op elsewhere or when the
+    filesystem does not support it.
+    """
+
+    if size <= 0 or not hasattr(os, 'posix_fallocate'):
+        return
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            raise
+        # EOPNOTSUPP/EINVAL: filesystem can't preallocate, write normally
+
 def main():
-    if len(sys.argv) < 2:
+    ascii_mode = '--ascii' in sys.argv[1:]
+    args = [a for a in sys.argv[1:] if a != '--ascii']
+
+    if len(args) < 1:
         print("WAV to PROGMEM Converter")
         print()
         print("Usage:")
-        print("  python wav_to_progmem.py input.wav [output.h] [variable_name]")
+        print("  python wav_to_progmem.py [--ascii] input.wav [output.h] [variable_name]")
         print()
         print("Examples:")
         print("  python wav_to_progmem.py track1.wav")
         print("  python wav_to_progmem.py track1.wav track1_data.h")
         print("  python wav_to_progmem.py track1.wav track1_data.h my_audio")
+        print("  python wav_to_progmem.py --ascii track1.wav")
+        print()
+        print("By default creates output.h, output.S and output.bin (raw WAV")
+        print("copy embedded with .incbin). --ascii puts the data in output.h")
+        print("as a hex array instead.")
         print()
         print("⚠️  WARNING: Creates HUGE binaries!")
         print("    Better use LittleFS (see FlashWavPlayer example)")
         print()
         sys.exit(1)
 
-    wav_path = sys.argv[1]
+    wav_path = args[0]
 
     # Output path
-    if len(sys.argv) >= 3:
-        output_path = sys.argv[2]
+    if len(args) >= 2:
+        output_path = args[1]
     else:
         base_name = os.path.splitext(os.path.basename(wav_path))[0]
         output_path = f"{base_name}_data.h"
 
     # Variable name
-    if len(sys.argv) >= 4:
-        var_name = sys.argv[3]
+    if len(args) >= 3:
+        var_name = args[2]
     else:
         var_name = None
 
+    output_base = os.path.splitext(output_path)[0]
+    asm_path = output_base + '.S'
+    data_path = output_base + '.bin'
+
     try:
-        header_code = wav_to_header(wav_path, var_name)
+        if ascii_mode:
+            header_code = wav_to_header(wav_path, var_name)
+            asm_code = None
+        else:
+            result = wav_to_incbin(wav_path, data_path, var_name)
+            header_code, asm_code = result if result is not None else (None, None)
 
         if header_code is None:
             print("Conversion cancelled")
             sys.exit(1)
 
-        with open(output_path, 'w') as f:
-            f.write(header_code)
+        # Generated code is ASCII apart from file names in comments;
+        # encoding it once and writing bytes skips the text I/O layer
+        header_bytes = header_code.encode('utf-8')
+        with open(output_path, 'wb', buffering=OUTPUT_BUFFER_SIZE) as f:
+            preallocate(f, len(header_bytes))
+            f.write(header_bytes)
+
+        if asm_code is not None:
+            shutil.copyfile(wav_path, data_path)
+            with open(asm_path, 'wb') as f:
+                f.write(asm_code.encode('utf-8'))
 
         print()
         print(f"✓ Header file created: {output_path}")
+        if asm_code is not None:
+            print(f"✓ Assembler file created: {asm_path}")
+            print(f"✓ Raw data copied to: {data_path}")
         print()
         print("Usage in Arduino sketch:")
         print(f"  #include \"{os.path.basename(output_path)}\"")
+        if asm_code is not None:
+            print(f"  (keep {os.path.basename(asm_path)} in the sketch folder, and")
+            print(f"   {os.path.basename(data_path)} where it is - the .S refers to it)")
         print()
         print("To play the audio:")
         print("  1. Copy data from PROGMEM to RAM buffer")